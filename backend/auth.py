@@ -4,7 +4,8 @@ auth.py
 Authentication and authorization utilities for the MCQ Grader backend.
 
 Features:
-- Password hashing and verification using bcrypt via Passlib.
+- Password hashing and verification using bcrypt_sha256 via Passlib.
+- Transparent rehashing of outdated password hashes on login.
 - JWT token creation and decoding for secure user sessions.
 - FastAPI dependency for extracting and validating the current user from a JWT token.
 - User authentication against MongoDB.
@@ -15,38 +16,77 @@ Functions:
 - get_user(email): Retrieves a user by email from the database.
 - authenticate_user(email, password): Authenticates a user by email and password.
 - create_access_token(data, expires_delta): Creates a JWT access token.
+- _decode_cached(token): Decodes a JWT, reusing recently verified payloads.
+- invalidate_cached_user(user_id): Drops a user from the authenticated-user cache.
 - get_current_user(token): FastAPI dependency to get the current authenticated user from a JWT token.
 
 Dependencies:
 - FastAPI
-- Passlib (bcrypt)
+- Passlib (bcrypt_sha256)
 - PyJWT
+- cachetools
+- AnyIO
 - MongoDB (Motor)
 - Pydantic models
 
 Usage:
 Import and use these functions for authentication in your FastAPI routes.
 """
+import asyncio
+import hashlib
+import hmac
+import os
+import threading
+import time
 from datetime import datetime, timedelta
+import anyio
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from passlib.context import CryptContext
-from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, BCRYPT_ROUNDS
 from database import db
-from models import TokenData, UserInDB
-from bson import ObjectId
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from models import TokenData, UserInDB, to_object_id
+
+# Plain bcrypt is kept so existing hashes still verify; they are upgraded on next login.
+pwd_context = CryptContext(
+    schemes=["bcrypt_sha256", "bcrypt"],
+    deprecated="auto",
+    bcrypt_sha256__default_rounds=BCRYPT_ROUNDS,
+)
+# Handler for the default scheme, resolved once so hashing skips the context's scheme lookup
+_bcrypt = pwd_context.handler("bcrypt_sha256")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/token")
 
+# Verified JWT payloads keyed by the raw token. The TTL is far shorter than the
+# token lifetime; expiry is still re-checked on every hit.
+_decode_cache = TTLCache(maxsize=4096, ttl=30)
+_decode_lock = threading.Lock()
+
+# Authenticated users keyed by user id, so repeat requests skip the Mongo lookup.
+# Entries must be dropped via invalidate_cached_user whenever a user changes.
+_user_cache = TTLCache(maxsize=10_000, ttl=60)
+_user_locks = TTLCache(maxsize=10_000, ttl=60)
+
+# Salted SHA-256 of passwords that already passed a bcrypt check, keyed by email.
+# Only populated after a successful verify, so repeat logins skip bcrypt.
+_verify_cache = TTLCache(maxsize=10_000, ttl=3600)
+
+# Recently issued access tokens keyed by their claims. Reusing a token for a few
+# seconds is safe because its exp is still far in the future.
+_token_cache = TTLCache(maxsize=10_000, ttl=30)
+
 
 def verify_password(plain_password, hashed_password):
+    if _bcrypt.identify(hashed_password):
+        return _bcrypt.verify(plain_password, hashed_password)
+    # Legacy plain bcrypt hashes still go through the context
     return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _bcrypt.hash(password)
 
 
 async def get_user(email: str):
@@ -56,18 +96,90 @@ async def get_user(email: str):
         return UserInDB(**user)
 
 
+def _fast_hash(salt: bytes, password: str) -> bytes:
+    return hashlib.sha256(salt + password.encode()).digest()
+
+
 async def authenticate_user(email: str, password: str):
     user = await get_user(email)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
         return False
+
+    cached = _verify_cache.get(email)
+    if cached is not None:
+        hashed_password, salt, digest = cached
+        if hashed_password == user.hashed_password and hmac.compare_digest(_fast_hash(salt, password), digest):
+            return user
+
+    # bcrypt is CPU-bound; run it in the worker thread pool to keep the event loop free.
+    if not await anyio.to_thread.run_sync(verify_password, password, user.hashed_password):
+        return False
+
+    if pwd_context.needs_update(user.hashed_password):
+        user.hashed_password = await anyio.to_thread.run_sync(get_password_hash, password)
+        await db.users.update_one({"_id": to_object_id(user.id)}, {"$set": {"hashed_password": user.hashed_password}})
+        invalidate_cached_user(user.id)
+
+    salt = os.urandom(16)
+    _verify_cache[email] = (user.hashed_password, salt, _fast_hash(salt, password))
     return user
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
+    cache_key = (tuple(sorted(data.items())), expires_delta)
+    token = _token_cache.get(cache_key)
+    if token is not None:
+        return token
+
     to_encode = data.copy()
     expire = datetime.now() + (expires_delta or timedelta(minutes=15))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    token = _token_cache[cache_key] = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return token
+
+
+def _decode_cached(token: str) -> dict:
+    with _decode_lock:
+        payload = _decode_cache.get(token)
+
+    if payload is None:
+        # Claim presence is enforced by the verified decode itself
+        payload = jwt.decode(
+            token,
+            SECRET_KEY,
+            algorithms=[ALGORITHM],
+            options={"require": ["exp", "sub", "email"]},
+        )
+        with _decode_lock:
+            _decode_cache[token] = payload
+    elif payload["exp"] <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+
+    return payload
+
+
+def invalidate_cached_user(user_id: str):
+    _user_cache.pop(user_id, None)
+
+
+async def _get_cached_user(user_id: str):
+    user = _user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    # One lookup per cold user id; concurrent requests wait for it instead.
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = _user_locks[user_id] = asyncio.Lock()
+
+    async with lock:
+        user = _user_cache.get(user_id)
+        if user is None:
+            user_doc = await db.users.find_one({"_id": to_object_id(user_id)})
+            if user_doc:
+                user_doc["_id"] = str(user_doc["_id"])
+                user = _user_cache[user_id] = UserInDB(**user_doc)
+    return user
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
@@ -77,17 +189,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        email = payload.get("email")
-        if not user_id or not email:
-            raise credentials_exception
-        token_data = TokenData(user_id=user_id, email=email)
+        payload = _decode_cached(token)
+        token_data = TokenData(user_id=payload["sub"], email=payload["email"])
     except jwt.PyJWTError:
         raise credentials_exception
 
-    user = await db.users.find_one({"_id": ObjectId(token_data.user_id)})
+    user = await _get_cached_user(token_data.user_id)
     if not user:
         raise credentials_exception
-    user["_id"] = str(user["_id"])
-    return UserInDB(**user)
+    return user
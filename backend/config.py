@@ -8,9 +8,13 @@ Configuration module for MCQ Grader backend.
 
 Variables:
 - MONGODB_URL: MongoDB connection string.
+- MONGODB_MAX_POOL_SIZE / MONGODB_MIN_POOL_SIZE: Motor connection pool bounds.
 - SECRET_KEY: Secret key for JWT token signing.
 - ALGORITHM: JWT signing algorithm.
 - ACCESS_TOKEN_EXPIRE_MINUTES: Token expiry duration in minutes.
+- BCRYPT_ROUNDS: bcrypt cost factor used when hashing passwords.
+- GRADER_WORKERS: Number of worker processes used to grade uploaded sheets.
+- GRADER_THREADS: PyTorch compute threads per grader worker.
 
 Usage:
 Import these variables wherever configuration is needed.
@@ -22,6 +26,19 @@ from dotenv import load_dotenv
 load_dotenv()
 
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+# Size the pool for peak request concurrency; requests beyond it queue for a connection.
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "10"))
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 3000
+
+# Each extra round doubles hashing cost; tune so a single hash takes ~250ms on the host.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Each worker holds its own PyTorch runtime and copy of the YOLO model, roughly 300-500 MB of RSS,
+# so the default of one worker per core needs that much memory per core; lower it on small hosts.
+GRADER_WORKERS = int(os.getenv("GRADER_WORKERS", str(os.cpu_count() or 1)))
+# Torch intra-op threads per worker; the default splits the cores between workers instead of
+# letting every worker spin up one thread per core.
+GRADER_THREADS = int(os.getenv("GRADER_THREADS", str(max(1, (os.cpu_count() or 1) // GRADER_WORKERS))))
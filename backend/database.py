@@ -4,14 +4,35 @@ database.py
 MongoDB connection setup for MCQ Grader backend.
 
 - Uses Motor (async MongoDB driver) for non-blocking database operations.
-- Loads MongoDB connection string from config.py.
+- Loads MongoDB connection string and pool settings from config.py.
+- A single shared client is used for the whole process; Motor multiplexes requests over its pool.
+- warm_up(): Pings the server so the pool is connected before the first request.
+- ensure_indexes(): Creates the indexes the API queries rely on (called at startup).
 
 Usage:
 Import 'db' to access the database in your FastAPI routes and modules.
 """
 from motor.motor_asyncio import AsyncIOMotorClient
-from config import MONGODB_URL
+from config import MONGODB_URL, MONGODB_MAX_POOL_SIZE, MONGODB_MIN_POOL_SIZE
 # from pymongo.server_api import ServerApi # Not needed if you're not using it directly
 
-client = AsyncIOMotorClient(MONGODB_URL)
-db = client.mcq_grader
\ No newline at end of file
+client = AsyncIOMotorClient(
+    MONGODB_URL,
+    maxPoolSize=MONGODB_MAX_POOL_SIZE,
+    minPoolSize=MONGODB_MIN_POOL_SIZE,
+    serverSelectionTimeoutMS=3000,
+    compressors="zstd,zlib",
+)
+db = client.mcq_grader
+
+SCRIPTS_BY_TEST_INDEX = [("test_id", 1), ("index_number", 1)]
+
+
+async def warm_up():
+    await db.command("ping")
+
+
+async def ensure_indexes():
+    await db.users.create_index("email", unique=True)
+    await db.tests.create_index("user_id")
+    await db.scripts.create_index(SCRIPTS_BY_TEST_INDEX)
@@ -4,11 +4,15 @@ main.py
 Entry point for the MCQ Grader backend API.
 
 Features:
-- FastAPI application setup.
+- FastAPI application setup, serializing responses with orjson.
 - Includes routers for user and test management.
 - Endpoints for processing MCQ answer sheets and mark schemes.
 - Handles file uploads and image processing using YOLO-based detection.
+- Grades uploaded sheets in a process pool so CPU-bound detection never blocks the event loop;
+  the pool is rebuilt if a worker dies.
 - Integrates with MongoDB for data storage.
+- Warms the MongoDB connection pool and ensures indexes exist on startup.
+- Prepares the YOLO model (download and optional export) on startup, before the grader pool starts.
 
 Key Endpoints:
 - GET /: Health check endpoint.
@@ -20,27 +24,86 @@ Key Endpoints:
 Usage:
 Run with: uvicorn main:app --reload
 """
-import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import orjson
 from fastapi import FastAPI, File, UploadFile, Form, Request, Body
-from fastapi.responses import JSONResponse
-from werkzeug.utils import secure_filename
-import shutil
-from bson import ObjectId
+from fastapi.responses import JSONResponse, ORJSONResponse
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel
 from users import router as users_router
 from tests import add_script, add_scheme, router as tests_router
-from models import ImageProcessingRequest
-from database import db
-from yolo_based_mark_detection import *
+from models import ImageProcessingRequest, to_object_id
+from database import db, ensure_indexes, warm_up
+from config import GRADER_THREADS, GRADER_WORKERS
+from yolo_based_mark_detection import grade_sheet, init_grader_worker, prepare_model
+
+
+class MarkingJSONResponse(ORJSONResponse):
+    """
+    orjson-backed response that falls back to str() for types orjson doesn't know (e.g. ObjectId).
+    """
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=str,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        )
 
 
-app = FastAPI(title="Marking API")
+app = FastAPI(title="Marking API", default_response_class=MarkingJSONResponse)
 
 app.include_router(users_router, prefix="/users", tags=["users"])
 app.include_router(tests_router, prefix="/tests", tags=["tests"])
 
 
+@app.on_event("startup")
+async def startup():
+    await warm_up()
+    await ensure_indexes()
+    # Download/export the model once here, so workers never race to build it themselves
+    await asyncio.to_thread(prepare_model)
+    app.state.pool = _new_grader_pool()
+    app.state.pool_lock = asyncio.Lock()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Don't block the event loop on gradings still running in the workers
+    app.state.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _new_grader_pool():
+    # spawn rather than fork: the parent already runs the event loop and driver threads
+    return ProcessPoolExecutor(
+        max_workers=GRADER_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_grader_worker,
+        initargs=(GRADER_THREADS,),
+    )
+
+
+async def _run_grader(*args):
+    """
+    Runs grade_sheet in the worker pool. If a worker died (e.g. OOM-killed) the pool is
+    broken for good, so it is replaced once and the grading retried.
+    """
+    loop = asyncio.get_running_loop()
+    pool = app.state.pool
+    try:
+        return await loop.run_in_executor(pool, grade_sheet, *args)
+    except BrokenProcessPool:
+        async with app.state.pool_lock:
+            # Concurrent failures share one replacement
+            if app.state.pool is pool:
+                print("Grader pool is broken, starting a new one.")
+                app.state.pool = _new_grader_pool()
+                pool.shutdown(wait=False, cancel_futures=True)
+        return await loop.run_in_executor(app.state.pool, grade_sheet, *args)
+
+
 class MarkSchemeRequest(BaseModel):
     file_id: str
     test_id: str
@@ -105,41 +168,24 @@ async def process_direct(
     scheme_or_paper: bool = Form(...),
 ):
     try:
-        # Create a temporary file path to save the uploaded image
-        temp_file_path = f"temp_{file.filename}"
-
-        # Save the uploaded file
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Read the uploaded image into memory; it is decoded directly by the grader
+        image_bytes = await file.read()
 
         # If we're marking an answer paper, we need the mark scheme
         if not scheme_or_paper:
-            test = await db.tests.find_one({"_id": ObjectId(test_id)})
+            test = await db.tests.find_one({"_id": to_object_id(test_id)}, projection={"scheme": 1})
             mark_scheme = test["scheme"]
         else:
             mark_scheme = []
 
-        # Process the image using MarkingScheme
-        scheme = McqMarker(
-            image_path=temp_file_path,
-            test_id=test_id,
-            total_questions=end_number,
-            is_scheme=scheme_or_paper,
-            scheme=mark_scheme,
+        # Grade the image in a worker process
+        results = await _run_grader(
+            image_bytes,
+            test_id,
+            end_number,
+            scheme_or_paper,
+            mark_scheme,
         )
-        scheme.start_shading_processing()
-
-        # Process based on whether it's a scheme or answer paper
-        if scheme_or_paper:
-            pass
-        else:
-            scheme.start_indx_processing()
-
-        scheme.start_answer_processing()
-        results = scheme.marking_outcome()
-
-        # Clean up temporary file
-        os.remove(temp_file_path)
 
         # Save the results to the database
         if scheme_or_paper:
@@ -151,9 +197,6 @@ async def process_direct(
 
     except Exception as e:
         print("Error:", e)
-        # Clean up temp file if it exists
-        if "temp_file_path" in locals() and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
@@ -16,15 +16,28 @@ Classes:
 - TestBase, TestCreate, TestUpdate, Test, TestInDB: Test models for CRUD operations.
 - ImageProcessingRequest: Model for image processing API requests.
 
+Functions:
+- to_object_id(value): Converts a hex string to an ObjectId, caching recent conversions.
+
 Usage:
 Import these models for request validation, response formatting, and database operations.
 """
+from functools import lru_cache
 from bson import ObjectId
+from bson.errors import InvalidId
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any
 from pydantic_core import CoreSchema, PydanticCustomError, core_schema
 from pydantic.json_schema import JsonSchemaValue
 
+@lru_cache(maxsize=4096)
+def to_object_id(value: str) -> ObjectId:
+    """
+    Parses a hex string into an ObjectId. The same test/user ids recur across
+    requests, so recent conversions are cached (ObjectId is immutable).
+    """
+    return ObjectId(value)
+
 class PyObjectId(ObjectId):
     """
     Pydantic V2 compatible ObjectId custom type.
@@ -38,9 +51,10 @@ class PyObjectId(ObjectId):
         This tells Pydantic how to validate and serialize the type.
         """
         def validate_object_id(value: str) -> ObjectId:
-            if not ObjectId.is_valid(value):
+            try:
+                return to_object_id(value)
+            except (InvalidId, TypeError):
                 raise PydanticCustomError('invalid_object_id', 'Invalid ObjectId')
-            return ObjectId(value)
 
         # This schema will first validate a string and then pass it to our custom validator.
         # It also specifies how to serialize the ObjectId back to a string for JSON.
@@ -57,15 +71,6 @@ class Script(BaseModel):
     answers: List[Any] = []
     score: int
 
-    class Config:
-        # Pydantic V2 no longer needs json_encoders for custom types defined this way.
-        # The serialization is handled by __get_pydantic_core_schema__.
-        # This is kept for any other potential ObjectId usage not as a PyObjectId.
-        # Alternatively, you can use model_config.
-        json_encoders = {ObjectId: str}
-        # Pydantic V2 recommended config style.
-        # model_config = ConfigDict(json_encoders={ObjectId: str})
-
 class UserBase(BaseModel):
     email: str
     displayName: str
@@ -78,9 +83,6 @@ class UserInDB(UserBase):
     id: str = Field(alias="_id")
     hashed_password: str
 
-    class Config:
-        json_encoders = {ObjectId: str}
-
 class User(UserBase):
     id: str
 
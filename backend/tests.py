@@ -24,80 +24,98 @@ Endpoints:
 
 Helper Functions:
 - add_script(test_id, script): Add or update a script in the database.
+  Writes are queued and flushed to MongoDB in batches with a single bulk_write.
 - add_scheme(test_id, scheme): Add a marking scheme to a test.
 
 Usage:
 Import and include this router in your FastAPI app for test and script management.
 """
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, Body
 from typing import List, Dict, Any
-from bson import ObjectId
-from database import db
-from models import TestCreate, Test, Script, TestUpdate
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from database import db, SCRIPTS_BY_TEST_INDEX
+from models import TestCreate, Test, Script, TestUpdate, to_object_id
 from auth import get_current_user
 from models import User
 
 router = APIRouter()
 
+# --- Batched script writes ---
+# add_script queues an upsert and waits for it; a background writer flushes the
+# queue every SCRIPT_FLUSH_INTERVAL seconds or as soon as SCRIPT_BATCH_SIZE ops are queued.
+SCRIPT_BATCH_SIZE = 100
+SCRIPT_FLUSH_INTERVAL = 0.05
+
+_pending_scripts = []
+_scripts_queued = asyncio.Event()
+_script_writer_task = None
+# Strong references to in-flight inline flushes, so they aren't garbage collected mid-write
+_flush_tasks = set()
+
 @router.post("/", response_model=Test)
 async def create_test(test: TestCreate, current_user: User = Depends(get_current_user)):
-    test_dict = test.dict()
+    test_dict = test.model_dump()
     result = await db.tests.insert_one({**test_dict, "user_id": current_user.id})
     return {**test_dict, "id": str(result.inserted_id)}
 
 @router.get("/", response_model=List[Test])
 async def get_user_tests(current_user: User = Depends(get_current_user)):
-    tests = []
-    async for test in db.tests.find({"user_id": current_user.id}):
-        tests.append({**test, "id": str(test["_id"])})
-    return tests
+    docs = await db.tests.find({"user_id": current_user.id}).to_list(length=None)
+    return [{**test, "id": str(test["_id"])} for test in docs]
 
 @router.get("/{test_id}", response_model=Test)
 async def get_test(test_id: str, current_user: User = Depends(get_current_user)):
-    test = await db.tests.find_one({"_id": ObjectId(test_id), "user_id": current_user.id})
+    test = await db.tests.find_one({"_id": to_object_id(test_id), "user_id": current_user.id})
     if test is None:
         raise HTTPException(status_code=404, detail="Test not found")
     return {**test, "id": str(test["_id"])}
 
 @router.put("/{test_id}", response_model=TestUpdate)
 async def update_test(test_id: str, test: TestCreate, current_user: User = Depends(get_current_user)):
-    test_dict = test.dict()
-    await db.tests.update_one({"_id": ObjectId(test_id), "user_id": current_user.id}, {"$set": test_dict})
+    test_dict = test.model_dump()
+    await db.tests.update_one({"_id": to_object_id(test_id), "user_id": current_user.id}, {"$set": test_dict})
     return {**test_dict, "id": test_id}
 
 @router.delete("/{test_id}")
 async def delete_test(test_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.tests.delete_one({"_id": ObjectId(test_id), "user_id": current_user.id})
-    # Also delete all scripts associated with the test
-    await db.scripts.delete_many({"test_id": ObjectId(test_id)})
+    # The test and its scripts live in separate collections, so both deletes run concurrently
+    result, _ = await asyncio.gather(
+        db.tests.delete_one({"_id": to_object_id(test_id), "user_id": current_user.id}),
+        db.scripts.delete_many({"test_id": to_object_id(test_id)}),
+    )
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Test not found")
     return {"message": "Test and associated scripts deleted successfully"}
 
 @router.delete("/")
 async def delete_all_tests(current_user: User = Depends(get_current_user)):
-    # Get all test IDs for the user
-    test_ids = [test["_id"] async for test in db.tests.find({"user_id": current_user.id})]
-    
+    # Get all test IDs for the user; distinct returns only the ids, not whole documents.
+    # This must finish before the tests are deleted below.
+    test_ids = await db.tests.distinct("_id", {"user_id": current_user.id})
+
     # Delete all tests and their associated scripts
     if test_ids:
-        await db.tests.delete_many({"user_id": current_user.id})
-        await db.scripts.delete_many({"test_id": {"$in": test_ids}})
+        await asyncio.gather(
+            db.tests.delete_many({"user_id": current_user.id}),
+            db.scripts.delete_many({"test_id": {"$in": test_ids}}),
+        )
     
     return {"message": "All tests and associated scripts deleted successfully"}
 
 # New endpoint for adding a script
 @router.post("/scripts", response_model=Script)
 async def add_script_to_collection(script: Script, current_user: User = Depends(get_current_user)):
-    test = await db.tests.find_one({"_id": ObjectId(script.test_id), "user_id": current_user.id})
+    test = await db.tests.find_one({"_id": script.test_id, "user_id": current_user.id}, projection={"_id": 1})
     if not test:
         raise HTTPException(status_code=404, detail="Test not found or not owned by user")
     
-    script_dict = script.dict(by_alias=True)
+    script_dict = script.model_dump(by_alias=True)
 
     result = await db.scripts.find_one_and_replace(
         filter={
-            "test_id": ObjectId(script.test_id),
+            "test_id": script.test_id,
             "index_number": script.index_number
         },
         replacement=script_dict,
@@ -109,49 +127,110 @@ async def add_script_to_collection(script: Script, current_user: User = Depends(
 
 @router.get("/{test_id}/scripts", response_model=List[Dict[str, Any]])
 async def get_test_scripts(test_id: str, current_user: User = Depends(get_current_user)):
-    test = await db.tests.find_one({"_id": ObjectId(test_id), "user_id": current_user.id})
+    test = await db.tests.find_one({"_id": to_object_id(test_id), "user_id": current_user.id}, projection={"_id": 1})
     if test is None:
         raise HTTPException(status_code=404, detail="Test not found")
     
-    scripts = []
-    async for script in db.scripts.find({"test_id": ObjectId(test_id)}):
+    scripts = await db.scripts.find(
+        {"test_id": to_object_id(test_id)},
+        projection={"_id": 1, "index_number": 1, "score": 1, "answers": 1, "test_id": 1},
+    ).hint(SCRIPTS_BY_TEST_INDEX).batch_size(200).to_list(length=None)
+    for script in scripts:
         script['_id'] = str(script['_id'])
         script['test_id'] = str(script['test_id'])
-        scripts.append(script)
     return scripts
 
 @router.delete("/{test_id}/scripts/{index_number}")
 async def delete_script_from_test(test_id: str, index_number: str, current_user: User = Depends(get_current_user)):
-    result = await db.scripts.delete_one({"test_id": ObjectId(test_id), "index_number": index_number})
+    result = await db.scripts.delete_one({"test_id": to_object_id(test_id), "index_number": index_number})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Script not found")
     return {"message": "Script deleted successfully"}
 
 @router.delete("/{test_id}/scripts")
 async def delete_all_scripts_from_test(test_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.scripts.delete_many({"test_id": ObjectId(test_id)})
+    result = await db.scripts.delete_many({"test_id": to_object_id(test_id)})
     return {"message": "All scripts deleted successfully"}
 
+async def _flush_pending_scripts():
+    if not _pending_scripts:
+        return
+
+    batch = _pending_scripts[:]
+    _pending_scripts.clear()
+
+    errors = {}
+    try:
+        result = await db.scripts.bulk_write([op for op, _ in batch], ordered=False)
+        upserted = set(result.upserted_ids)
+    except BulkWriteError as e:
+        errors = {err["index"]: err for err in e.details.get("writeErrors", [])}
+        upserted = {u["index"] for u in e.details.get("upserted", [])}
+    except Exception as e:
+        _fail_scripts(batch, e)
+        return
+    except BaseException:
+        # Cancelled mid-write (e.g. on shutdown): fail the batch rather than leave its callers waiting forever
+        _fail_scripts(batch, RuntimeError("Script write was interrupted"))
+        raise
+
+    for i, (_, future) in enumerate(batch):
+        if future.done():
+            continue
+        if i in errors:
+            future.set_exception(RuntimeError(errors[i].get("errmsg", "Script write failed")))
+        else:
+            future.set_result(i in upserted)
+
+def _fail_scripts(batch, exc):
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(exc)
+
+async def _script_writer():
+    while True:
+        await _scripts_queued.wait()
+        await asyncio.sleep(SCRIPT_FLUSH_INTERVAL)
+        _scripts_queued.clear()
+        await _flush_pending_scripts()
+
+def _ensure_script_writer():
+    global _script_writer_task
+    if _script_writer_task is None or _script_writer_task.done():
+        _script_writer_task = asyncio.create_task(_script_writer())
+
 async def add_script(test_id, script):
     script_data = {
-        "test_id": ObjectId(test_id),
+        "test_id": to_object_id(test_id),
         "index_number": script["index_number"],
         "score": script["score"],
         "answers": script.get("answers", []), # Use .get for robustness
         "script_file_id": script.get("script_file_id", ""),
     }
 
-    result = await db.scripts.update_one(
-        {"test_id": ObjectId(test_id), "index_number": script["index_number"]},
+    op = UpdateOne(
+        {"test_id": to_object_id(test_id), "index_number": script["index_number"]},
         {"$set": script_data},
         upsert=True
     )
-    
-    if result.upserted_id:
+    future = asyncio.get_running_loop().create_future()
+    _pending_scripts.append((op, future))
+
+    if len(_pending_scripts) >= SCRIPT_BATCH_SIZE:
+        # Flush in its own task, so cancelling this request can't strand the rest of the batch
+        task = asyncio.create_task(_flush_pending_scripts())
+        _flush_tasks.add(task)
+        task.add_done_callback(_flush_tasks.discard)
+    else:
+        _ensure_script_writer()
+        _scripts_queued.set()
+
+    # Resolves once the batch holding this write has been flushed
+    if await future:
         return "Script added successfully"
     else:
         return "Script updated successfully"
 
 async def add_scheme(test_id, scheme):
-    await db.tests.update_one({"_id": ObjectId(test_id)}, {"$set": {"scheme": scheme['scheme']}})
+    await db.tests.update_one({"_id": to_object_id(test_id)}, {"$set": {"scheme": scheme['scheme']}})
     return "Scheme added successfully"
\ No newline at end of file
@@ -4,7 +4,7 @@ users.py
 User authentication and management endpoints for the MCQ Grader backend.
 
 Features:
-- User registration with password hashing and duplicate email check.
+- User registration with password hashing; duplicate emails are rejected by a unique index.
 - JWT-based login and token generation.
 - Endpoint to retrieve the current authenticated user's profile.
 
@@ -16,8 +16,10 @@ Endpoints:
 Usage:
 Import and include this router in your FastAPI app for user management.
 """
+import anyio
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from pymongo.errors import DuplicateKeyError
 from database import db
 from models import UserCreate, User, Token, UserResponse
 from auth import get_password_hash, authenticate_user, create_access_token, get_current_user
@@ -28,17 +30,17 @@ router = APIRouter()
 
 @router.post("/register", response_model=UserResponse)
 async def register_user(user: UserCreate):
-    existing_user = await db.users.find_one({"email": user.email})
-    if existing_user:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
-
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await anyio.to_thread.run_sync(get_password_hash, user.password)
 
-    user_dict = user.dict()
+    user_dict = user.model_dump()
     user_dict.pop("password")
     user_dict["hashed_password"] = hashed_password
 
-    result = await db.users.insert_one(user_dict)
+    # users.email has a unique index (see database.ensure_indexes)
+    try:
+        result = await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
 
     user_dict["id"] = str(result.inserted_id)
 
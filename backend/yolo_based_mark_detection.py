@@ -5,40 +5,139 @@ YOLO-based mark detection and grading logic for MCQ Grader backend.
 
 Features:
 - Downloads YOLO model weights from AWS S3 for local inference.
-- Loads and resizes answer sheet images for processing.
+- Optionally exports the weights to a compiled backend (OpenVINO, TensorRT, ONNX) via MODEL_EXPORT_FORMAT,
+  quantized to FP16 (MODEL_HALF) or INT8 (MODEL_INT8_DATA calibration dataset).
+- Loads and resizes answer sheet images for processing, from disk or from in-memory bytes.
 - Detects regions of interest (ROI) for index numbers and answers using YOLO.
-- Calculates bubble centers for index and answer regions.
+- Calculates bubble centers for index and answer regions (answer grids and their KD-trees are cached per ROI).
 - Maps detected marks to bubbles for extracting index numbers and answers.
 - Generates mark schemes from correctly shaded sheets.
 - Grades student answer sheets against a mark scheme.
-- Visualizes detected ROIs and marks for debugging and verification.
+- Visualizes detected ROIs and marks for debugging and verification (only when MCQ_DEBUG_PLOTS=1).
 
 Classes:
 - McqMarker: Main class for image processing, mark detection, and grading.
 
+Functions:
+- init_grader_worker(num_threads): Process pool initializer that caps PyTorch threads per worker.
+- prepare_model(): Downloads and exports the model ahead of time, returning the path to load.
+- grade_sheet(image_bytes, test_id, total_questions, is_scheme, scheme): Runs the full
+  pipeline for one uploaded sheet. Picklable, so it can be submitted to a process pool.
+
 Usage:
-Instantiate McqMarker with image path, test ID, total questions, and scheme flag.
+Instantiate McqMarker with image path (or encoded image bytes), test ID, total questions, and scheme flag.
 Call methods to process shading, extract index, extract answers, and calculate score.
 """
 import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import boto3
 from botocore.exceptions import ClientError
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.pyplot import figure
+from scipy.spatial import cKDTree
+import torch
 from ultralytics import YOLO 
 
 
+# Shared S3 client, created on the first download; model cache hits never build one
+_S3_CLIENT = None
+
+
+def _get_s3():
+    global _S3_CLIENT
+    if _S3_CLIENT is None:
+        _S3_CLIENT = boto3.client('s3')
+    return _S3_CLIENT
+
+
+def _env_flag(name):
+    # Tolerant boolean env parsing; anything unrecognised counts as off rather than raising
+    return os.getenv(name, "0").strip().lower() in {"1", "true", "yes", "on"}
+
+
+# Where Ultralytics writes each export format, relative to the .pt checkpoint path
+_EXPORT_SUFFIXES = {
+    "openvino": "_openvino_model",
+    "engine": ".engine",
+    "onnx": ".onnx",
+}
+
+# Exports take a dynamic batch of up to this many sheets (TensorRT builds its optimization
+# profile for it); run_batch never sends more than this per inference call.
+_EXPORT_MAX_BATCH = 8
+
+
+# --- Answer sheet layout as fractions of the answers ROI ---
+# Column (start, end) ratios based on your reference
+_COL_RATIOS = np.array([[35, 175], [235, 375], [435, 570], [635, 770], [830, 965]], dtype=np.float64) / 965
+_QUESTIONS_PER_GROUP = 5
+_GROUPS_PER_COLUMN = 8
+_QUESTIONS_PER_COLUMN = _QUESTIONS_PER_GROUP * _GROUPS_PER_COLUMN
+_GAP_HEIGHT_RATIO = 0.022
+_SEGMENT_HEIGHT_RATIO = (1 - ((_GROUPS_PER_COLUMN - 1) * _GAP_HEIGHT_RATIO)) / _QUESTIONS_PER_COLUMN
+
+# Row edges accumulate segment and gap heights in the same order as walking the sheet
+# top to bottom, so truncated pixel rows match a running sum exactly
+_ROW_STEP_IS_GAP = np.tile([False] * _QUESTIONS_PER_GROUP + [True], _GROUPS_PER_COLUMN)[:-1]
+_ROW_EDGE_RATIOS = np.concatenate(([0.0], np.cumsum(
+    np.where(_ROW_STEP_IS_GAP, _GAP_HEIGHT_RATIO, _SEGMENT_HEIGHT_RATIO)
+)))
+_ROW_CENTER_RATIOS = _ROW_EDGE_RATIOS[:-1][~_ROW_STEP_IS_GAP] + (_SEGMENT_HEIGHT_RATIO / 2)
+
+for _arr in (_COL_RATIOS, _ROW_STEP_IS_GAP, _ROW_EDGE_RATIOS, _ROW_CENTER_RATIOS):
+    _arr.setflags(write=False)
+
+
+@lru_cache(maxsize=8)
+def _compute_bubble_centers(x_start, y_start, roi_width, roi_height, options):
+    """
+    Builds the answer bubble grid for an ROI and a KD-tree over it. Returns read-only
+    arrays since the result is shared between callers through the cache.
+    """
+    options_per_question = len(options)
+
+    # Whole-pixel column boundaries, relative to the ROI
+    column_boundaries = (roi_width * _COL_RATIOS).astype(np.int64)
+    column_boundaries.setflags(write=False)
+    col_start_px, col_end_px = column_boundaries.T
+    option_width_px = (col_end_px - col_start_px) / options_per_question
+
+    q_center_y_px = (_ROW_CENTER_RATIOS * roi_height).astype(np.int64)
+
+    # Flat grid ordered (column, row, option): bubble i is question i // options_per_question + 1
+    col_idx, row_idx, option_idx = np.meshgrid(
+        np.arange(len(column_boundaries)), np.arange(_QUESTIONS_PER_COLUMN), np.arange(options_per_question),
+        indexing='ij'
+    )
+    x_center_px = col_start_px[col_idx] + (option_idx * option_width_px[col_idx]) + (option_width_px[col_idx] / 2)
+    bubble_xy = np.stack([x_center_px + x_start, q_center_y_px[row_idx] + y_start], axis=-1)
+    bubble_xy = bubble_xy.reshape(-1, 2).astype(np.float32)
+    bubble_xy.setflags(write=False)
+
+    return bubble_xy, cKDTree(bubble_xy), column_boundaries
+
+
 class McqMarker:
-    def __init__(self, image_path, test_id, total_questions, is_scheme, scheme=[]) -> None:
+    # YOLO model shared by every marker in this process, loaded on first use.
+    _model = None
+
+    def __init__(self, image_path, test_id, total_questions, is_scheme, scheme=None, image_bytes=None) -> None:
         self.image_path = image_path
+        # Encoded image (e.g. an uploaded JPEG); takes precedence over image_path when given.
+        self.image_bytes = image_bytes
+        self._cached_img = None
 
         # --- Target Image Dimensions for Processing ---
         # This is the fixed size your input image will be resized to.
         self.width = 2100
         self.height = 3050
 
+        # Debug overlays of the detected ROIs and marks are written to disk only when enabled
+        self.debug = _env_flag("MCQ_DEBUG_PLOTS")
+
         # --- Initializing ROI coordinates. They will be populated by the model's detections. ---
         self.indx_roi_coords = None
         self.answers_roi_coords = None
@@ -48,18 +147,25 @@ class McqMarker:
         self.s3_model_key = os.getenv("S3_MODEL_KEY", "best_omr_model.pt")
         self.local_model_path = os.getenv("LOCAL_MODEL_PATH", "/tmp/best_omr_model.pt")
    
+        # --- Inference backend: "" keeps the PyTorch checkpoint, "openvino" suits CPU hosts, "engine" CUDA hosts ---
+        self.export_format = os.getenv("MODEL_EXPORT_FORMAT", "").lower()
+        # Mark detection tolerates small confidence shifts, so reduced precision is safe here
+        self.half = _env_flag("MODEL_HALF")
+        self.int8_data = os.getenv("MODEL_INT8_DATA", "")
+
         # Download model from S3
         self._download_model_from_s3()
 
-        self.model_path = self.local_model_path
-        self.detected_indx_marks = []
-        self.detected_answers_marks = []
+        self.model_path = self._export_model()
+        # Detected marks as (N, 3) float32 arrays of (center_x, center_y, confidence)
+        self.detected_indx_marks = np.empty((0, 3), dtype=np.float32)
+        self.detected_answers_marks = np.empty((0, 3), dtype=np.float32)
         self.test_id = test_id
         self.questions = total_questions
         self.is_scheme = is_scheme
         self.index_number = ""
         self.student_answer = []
-        self.mark_scheme = scheme
+        self.mark_scheme = scheme if scheme is not None else []
         self.score = 0
         self.options = ['A', 'B', 'C', 'D', 'E']
 
@@ -69,7 +175,7 @@ class McqMarker:
             print(f"Model already exists at {self.local_model_path}, skipping download.")
             return
 
-        s3 = boto3.client('s3')
+        s3 = _get_s3()
         try:
             print(f"Downloading model {self.s3_model_key} from S3 bucket {self.s3_bucket_name} to {self.local_model_path}...")
             s3.download_file(self.s3_bucket_name, self.s3_model_key, self.local_model_path)
@@ -83,14 +189,73 @@ class McqMarker:
             print(f"An unexpected error occurred during S3 download: {e}")
             raise
 
+    def _export_model(self):
+        # LOCAL_MODEL_PATH may already point at an exported (e.g. pre-quantized) artifact
+        if not self.export_format or not self.local_model_path.endswith(".pt"):
+            return self.local_model_path
+        if self.export_format not in _EXPORT_SUFFIXES:
+            raise ValueError(f"Unsupported MODEL_EXPORT_FORMAT: {self.export_format}")
+
+        # Exports are cached next to the checkpoint and only built once
+        suffix = _EXPORT_SUFFIXES[self.export_format]
+        if self.int8_data and self.export_format == "openvino":
+            # Ultralytics names INT8 OpenVINO exports <stem>_int8_openvino_model
+            suffix = "_int8" + suffix
+        exported_path = os.path.splitext(self.local_model_path)[0] + suffix
+        if os.path.exists(exported_path):
+            return exported_path
+
+        print(f"Exporting {self.local_model_path} to {self.export_format}...")
+        # A dynamic batch axis lets run_batch send several sheets per call; OpenVINO then picks its
+        # cumulative-throughput mode for batch > 1
+        export_args = {"format": self.export_format, "half": self.half, "dynamic": True, "batch": _EXPORT_MAX_BATCH}
+        if self.int8_data:
+            export_args.update(int8=True, data=self.int8_data)
+
+        # Export from a private copy and move the result into place with one rename, so other
+        # processes never load a half-written export; if another process got there first, use theirs
+        model_dir = os.path.dirname(os.path.abspath(self.local_model_path))
+        with tempfile.TemporaryDirectory(dir=model_dir) as tmp_dir:
+            tmp_model_path = os.path.join(tmp_dir, os.path.basename(self.local_model_path))
+            shutil.copyfile(self.local_model_path, tmp_model_path)
+            built_path = YOLO(tmp_model_path).export(**export_args)
+            try:
+                os.replace(built_path, exported_path)
+            except OSError:
+                if not os.path.exists(exported_path):
+                    raise
+        print(f"Model exported to {exported_path}.")
+        return exported_path
+
+    @classmethod
+    def _get_model(cls, model_path):
+        if cls._model is None:
+            # Exported models do not always record their task, so it is given explicitly
+            cls._model = YOLO(model_path, task='detect')
+        return cls._model
+
     def load_image(self):
-        image = cv2.imread(self.image_path)
-        if image is None:
-            print("Error: Could not load image.")
-            exit()
+        # Decoded and resized once per marker; callers that draw on it must copy first
+        if self._cached_img is None:
+            if self.image_bytes is not None:
+                image = cv2.imdecode(np.frombuffer(self.image_bytes, np.uint8), cv2.IMREAD_COLOR)
+            else:
+                image = cv2.imread(self.image_path)
+            if image is None:
+                raise ValueError("Could not load image.")
 
-        img = cv2.resize(image, (self.width, self.height))
-        return img
+            self._cached_img = self._resize_to_target(image)
+        return self._cached_img
+
+    def _resize_to_target(self, image):
+        h, w = image.shape[:2]
+        # Many scanners already produce the target resolution
+        if (h, w) == (self.height, self.width):
+            return image
+
+        # INTER_AREA is the better (and cheaper) kernel for shrinking, INTER_LINEAR for enlarging
+        interpolation = cv2.INTER_AREA if h > self.height else cv2.INTER_LINEAR
+        return cv2.resize(image, (self.width, self.height), interpolation=interpolation)
 
     def start_indx_processing(self):
         if self.indx_roi_coords is None:
@@ -119,143 +284,67 @@ class McqMarker:
         column_width_segment = roi_width / num_columns
         digit_row_height_segment = roi_height / num_digits_per_column
         
-        # --- Create a list of all digit bubble centers ---
-        digit_centers = []
-        for col_idx in range(num_columns):
-            for digit in range(num_digits_per_column):
-                center_x = x_start + (col_idx * column_width_segment) + (column_width_segment / 2)
-                center_y = y_start + (digit * digit_row_height_segment) + (digit_row_height_segment / 2)
-                digit_centers.append({
-                    'x': center_x,
-                    'y': center_y,
-                    'col': col_idx,
-                    'digit': str(digit)
-                })
+        # --- Digit bubble centers as a (num_columns * num_digits_per_column, 2) array ---
+        # Flat index i is column i // num_digits_per_column, digit i % num_digits_per_column.
+        center_cols, center_digits = np.divmod(np.arange(num_columns * num_digits_per_column), num_digits_per_column)
+        centers_xy = np.stack([
+            x_start + (center_cols * column_width_segment) + (column_width_segment / 2),
+            y_start + (center_digits * digit_row_height_segment) + (digit_row_height_segment / 2),
+        ], axis=1).astype(np.float32)
 
         # --- Map detected marks to the closest digit center ---
-        marks_per_column = [[] for _ in range(num_columns)]
-        for mark in self.detected_indx_marks:
-            min_dist = float('inf')
-            closest_digit_center = None
-            for center in digit_centers:
-                dist = np.sqrt((mark['center_x'] - center['x'])**2 + (mark['center_y'] - center['y'])**2)
-                if dist < min_dist:
-                    min_dist = dist
-                    closest_digit_center = center
-            
-            if closest_digit_center:
-                marks_per_column[closest_digit_center['col']].append(closest_digit_center['digit'])
-        
-        index_digits = ['X'] * num_columns
+        counts = np.zeros((num_columns, num_digits_per_column), dtype=np.int64)
+        if len(self.detected_indx_marks):
+            # Nearest of the 70 digit centers for every mark; the tree is cheap to build at this size
+            _, closest = cKDTree(centers_xy).query(self.detected_indx_marks[:, :2], k=1)
+            # Center k is (column k // 10, digit k % 10), so the flat histogram reshapes per column
+            counts = np.bincount(closest, minlength=counts.size).reshape(counts.shape)
+
         for col_idx in range(num_columns):
-            marks_in_col = marks_per_column[col_idx]
+            marks_in_col = np.repeat(center_digits[:num_digits_per_column], counts[col_idx]).astype(str).tolist()
             print(f"\ncol-idx: {col_idx}, marks: {marks_in_col}")
-            if not marks_in_col:
-                index_digits[col_idx] = 'X'
-            else:
-                unique_digits = list(set(marks_in_col))
-                if len(unique_digits) == 1:
-                    index_digits[col_idx] = unique_digits[0]
-                else:
-                    index_digits[col_idx] = 'M' 
 
-        indxNo = "".join(index_digits)
+        # 'X' when nothing is marked, the digit when exactly one is, 'M' otherwise
+        n_marked = np.count_nonzero(counts, axis=1)
+        index_digits = np.where(n_marked == 0, 'X', np.where(n_marked == 1, counts.argmax(1).astype(str), 'M'))
+
+        indxNo = "".join(index_digits.tolist())
         print(f"\nindexNo: {indxNo}")
         self.index_number = indxNo
 
-        indx_roi_img = self.load_image()
-        print(f"\nShape: {indx_roi_img.shape}")
-
-        for mark in self.detected_indx_marks:
-            cv2.circle(indx_roi_img, (int(mark['center_x']), int(mark['center_y'])), 5, (0, 255, 0), -1)
-            cv2.putText(indx_roi_img, f"{mark['confidence']:.2f}", (int(mark['center_x']) + 10, int(mark['center_y']) - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
-
-        # Draw the original detected ROI (Red)
-        cv2.rectangle(indx_roi_img, (int(orig_x_start), int(orig_y_start)), 
-                      (int(orig_x_end), int(orig_y_end)), (0, 0, 255), 2)
-        # Draw the new, reduced calculation ROI (Yellow)
-        cv2.rectangle(indx_roi_img, (int(x_start), int(y_start)), 
-                      (int(x_end), int(y_end)), (0, 255, 255), 2)
-
-        # Draw column and row lines for verification
-        for i in range(1, num_columns):
-            x_line = int(x_start + i * column_width_segment)
-            cv2.line(indx_roi_img, (x_line, int(y_start)), (x_line, int(y_end)), (255, 0, 0), 1)
-        for i in range(1, num_digits_per_column):
-            y_line = int(y_start + i * digit_row_height_segment)
-            cv2.line(indx_roi_img, (int(x_start), y_line), (int(x_end), y_line), (255, 0, 0), 1)
-
-        figure(figsize=(20,20), dpi=90)
-        plt.imshow(cv2.cvtColor(indx_roi_img, cv2.COLOR_BGR2RGB))
-        plt.title("Detected Index ROI (Red) and Calculation Bounding Box (Yellow)")
-        plt.axis('off')
-        plt.savefig('index_roi_plot.png')
-        print("Plot saved to index_roi_plot.png")
-        plt.close()
+        if self.debug:
+            indx_roi_img = self.load_image().copy()
+            print(f"\nShape: {indx_roi_img.shape}")
+
+            for center_x, center_y, confidence in self.detected_indx_marks:
+                cv2.circle(indx_roi_img, (int(center_x), int(center_y)), 5, (0, 255, 0), -1)
+                cv2.putText(indx_roi_img, f"{confidence:.2f}", (int(center_x) + 10, int(center_y) - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+
+            # Draw the original detected ROI (Red)
+            cv2.rectangle(indx_roi_img, (int(orig_x_start), int(orig_y_start)), 
+                          (int(orig_x_end), int(orig_y_end)), (0, 0, 255), 2)
+            # Draw the new, reduced calculation ROI (Yellow)
+            cv2.rectangle(indx_roi_img, (int(x_start), int(y_start)), 
+                          (int(x_end), int(y_end)), (0, 255, 255), 2)
+
+            # Draw column and row lines for verification
+            for i in range(1, num_columns):
+                x_line = int(x_start + i * column_width_segment)
+                cv2.line(indx_roi_img, (x_line, int(y_start)), (x_line, int(y_end)), (255, 0, 0), 1)
+            for i in range(1, num_digits_per_column):
+                y_line = int(y_start + i * digit_row_height_segment)
+                cv2.line(indx_roi_img, (int(x_start), y_line), (int(x_end), y_line), (255, 0, 0), 1)
+
+            # Detected Index ROI (Red) and Calculation Bounding Box (Yellow)
+            cv2.imwrite('index_roi_plot.jpg', indx_roi_img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            print("Plot saved to index_roi_plot.jpg")
 
     def _calculate_bubble_centers(self, x_start, y_start, roi_width, roi_height):
-        bubble_centers = {}
-        
-        # --- Ratios for column boundaries based on your reference ---
-        column_definitions_ratios = {
-            "firstCol":  (35 / 965,  175 / 965),
-            "secondCol": (235 / 965, 375 / 965),
-            "thirdCol":  (435 / 965, 570 / 965),
-            "fourthCol": (635 / 965, 770 / 965),
-            "fifthCol":  (830 / 965, 965 / 965)
-        }
-
-        # --- Ratios for vertical grid (rows and gaps) ---
-        questions_per_column = 40
-        options_per_question = len(self.options)
-        questions_per_group = 5
-        num_groups_per_column = 8
-        num_gaps = num_groups_per_column - 1
-
-        total_question_height_ratio = 1 - (num_gaps * 0.022) 
-        segment_height_ratio = total_question_height_ratio / questions_per_column
-        gap_height_ratio = 0.022
-
-        current_y_ratio = 0
-        q_num = 1
-        
-        column_boundaries = {}
-        for col_name, (start_ratio, end_ratio) in column_definitions_ratios.items():
-            start_px = int(roi_width * start_ratio)
-            end_px = int(roi_width * end_ratio)
-            column_boundaries[col_name] = (start_px, end_px)
-
-        for col_name, (col_start_px, col_end_px) in column_boundaries.items():
-            col_width_px = col_end_px - col_start_px
-            option_width_px = col_width_px / options_per_question
-            
-            current_y_ratio = 0
-            for group_idx in range(num_groups_per_column):
-                for q_in_group_idx in range(questions_per_group):
-                    q_center_y_ratio = current_y_ratio + (segment_height_ratio / 2)
-                    q_center_y_px = int(q_center_y_ratio * roi_height)
-                    
-                    for option_idx in range(options_per_question):
-                        x_center_px = col_start_px + (option_idx * option_width_px) + (option_width_px / 2)
-                        
-                        bubble_center = {
-                            'x': x_center_px + x_start,
-                            'y': q_center_y_px + y_start,
-                            'option': self.options[option_idx]
-                        }
-                        
-                        if q_num not in bubble_centers:
-                            bubble_centers[q_num] = []
-                        bubble_centers[q_num].append(bubble_center)
-                        
-                    current_y_ratio += segment_height_ratio
-                    q_num += 1
-                
-                if group_idx < num_gaps:
-                    current_y_ratio += gap_height_ratio
-        
-        return bubble_centers, column_boundaries, segment_height_ratio, gap_height_ratio
+        # The grid depends only on ROI geometry, so it is cached per whole-pixel ROI
+        return _compute_bubble_centers(
+            round(x_start), round(y_start), round(roi_width), round(roi_height), tuple(self.options)
+        )
 
 
     def start_answer_processing(self):
@@ -278,42 +367,28 @@ class McqMarker:
         roi_width = x_end - x_start
         
         # Calculate bubble centers based on the new, robust, ratio-based grid
-        bubble_centers_by_q, column_boundaries, segment_height_ratio, gap_height_ratio = self._calculate_bubble_centers(
+        bubble_xy, bubble_tree, column_boundaries = self._calculate_bubble_centers(
             x_start, y_start, roi_width, roi_height
         )
         
         # --- Map detected marks to the closest bubble center ---
-        marks_per_question = {}
-        for mark in self.detected_answers_marks:
-            min_dist = float('inf')
-            closest_bubble_center = None
-            closest_q_num = None
-            
-            for q_num, centers in bubble_centers_by_q.items():
-                for center in centers:
-                    dist = np.sqrt((mark['center_x'] - center['x'])**2 + (mark['center_y'] - center['y'])**2)
-                    if dist < min_dist:
-                        min_dist = dist
-                        closest_bubble_center = center
-                        closest_q_num = q_num
-            
-            if closest_q_num is not None:
-                if closest_q_num not in marks_per_question:
-                    marks_per_question[closest_q_num] = []
-                marks_per_question[closest_q_num].append(closest_bubble_center['option'])
+        options_per_question = len(self.options)
+        counts = np.zeros((len(bubble_xy) // options_per_question, options_per_question), dtype=np.int64)
+        if len(self.detected_answers_marks):
+            # Nearest bubble for every mark, from the tree cached with the grid
+            _, flat_idx = bubble_tree.query(self.detected_answers_marks[:, :2], k=1)
+            # Bubble k is (question k // 5 + 1, option k % 5), so the flat histogram reshapes per question
+            counts = np.bincount(flat_idx, minlength=counts.size).reshape(counts.shape)
+
+        # 'X' when nothing is marked, the option when exactly one is, 'M' otherwise
+        n_marked = np.count_nonzero(counts, axis=1)
+        detected_per_question = np.where(
+            n_marked == 0, 'X',
+            np.where(n_marked == 1, np.asarray(self.options)[counts.argmax(1)], 'M')
+        ).tolist()
 
         for q_num in range(1, self.questions + 1):
-            if q_num in marks_per_question:
-                detected_options = marks_per_question[q_num]
-                unique_options = list(set(detected_options))
-                
-                if len(unique_options) == 1:
-                    detected_answer = unique_options[0]
-                else:
-                    detected_answer = 'M' # Multiple different marks
-            else:
-                detected_answer = 'X'
-
+            detected_answer = detected_per_question[q_num - 1] if q_num <= len(detected_per_question) else 'X'
 
             if self.is_scheme:
                 self.mark_scheme.append({
@@ -332,56 +407,39 @@ class McqMarker:
                     'correct_answer': correct_answer
                 })
 
-        answer_roi_img = self.load_image()
-
-        for mark in self.detected_answers_marks:
-            cv2.circle(answer_roi_img, (int(mark['center_x']), int(mark['center_y'])), 5, (0, 255, 0), -1)
-            cv2.putText(answer_roi_img, f"{mark['confidence']:.2f}", (int(mark['center_x']) + 10, int(mark['center_y']) - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
-
-        # Draw the original detected ROI (Red)
-        cv2.rectangle(answer_roi_img, (int(orig_x_start), int(orig_y_start)), 
-                      (int(orig_x_end), int(orig_y_end)), (0, 0, 255), 2)
-        # Draw the new, reduced calculation ROI (Yellow)
-        cv2.rectangle(answer_roi_img, (int(x_start), int(y_start)), 
-                      (int(x_end), int(y_end)), (0, 255, 255), 2)
-        
-        # --- Draw the new ratio-based grid for verification ---
-        for col_name, (col_start_px, col_end_px) in column_boundaries.items():
-            cv2.line(answer_roi_img, (int(x_start + col_start_px), int(y_start)), 
-                     (int(x_start + col_start_px), int(y_end)), (255, 0, 0), 1)
-            cv2.line(answer_roi_img, (int(x_start + col_end_px), int(y_start)), 
-                     (int(x_start + col_end_px), int(y_end)), (255, 0, 0), 1)
-        
-        current_y_ratio = 0
-        questions_per_group = 5
-        num_groups_per_column = 8
-        num_gaps = num_groups_per_column - 1
-        
-        total_question_height_ratio = 1 - (num_gaps * 0.022)
-        segment_height_ratio = total_question_height_ratio / (questions_per_group * num_groups_per_column)
-        gap_height_ratio = 0.022
-
-        current_y_ratio = 0
-        for group_idx in range(num_groups_per_column):
-            for q_in_group_idx in range(questions_per_group):
-                y_line = int(y_start + (current_y_ratio + segment_height_ratio) * roi_height)
-                cv2.line(answer_roi_img, (int(x_start), y_line), (int(x_end), y_line), (255, 0, 0), 1)
-                current_y_ratio += segment_height_ratio
-            
-            if group_idx < num_gaps:
-                y_line = int(y_start + (current_y_ratio + gap_height_ratio) * roi_height)
-                cv2.line(answer_roi_img, (int(x_start), y_line), (int(x_end), y_line), (255, 255, 0), 2)
-                current_y_ratio += gap_height_ratio
-        
+        if self.debug:
+            answer_roi_img = self.load_image().copy()
+
+            for center_x, center_y, confidence in self.detected_answers_marks:
+                cv2.circle(answer_roi_img, (int(center_x), int(center_y)), 5, (0, 255, 0), -1)
+                cv2.putText(answer_roi_img, f"{confidence:.2f}", (int(center_x) + 10, int(center_y) - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+
+            # Draw the original detected ROI (Red)
+            cv2.rectangle(answer_roi_img, (int(orig_x_start), int(orig_y_start)), 
+                          (int(orig_x_end), int(orig_y_end)), (0, 0, 255), 2)
+            # Draw the new, reduced calculation ROI (Yellow)
+            cv2.rectangle(answer_roi_img, (int(x_start), int(y_start)), 
+                          (int(x_end), int(y_end)), (0, 255, 255), 2)
+
+            # --- Draw the new ratio-based grid for verification ---
+            for col_start_px, col_end_px in column_boundaries.tolist():
+                cv2.line(answer_roi_img, (int(x_start + col_start_px), int(y_start)), 
+                         (int(x_start + col_start_px), int(y_end)), (255, 0, 0), 1)
+                cv2.line(answer_roi_img, (int(x_start + col_end_px), int(y_start)), 
+                         (int(x_start + col_end_px), int(y_end)), (255, 0, 0), 1)
+
+            # Row bottoms in blue, group gaps in cyan
+            for edge_ratio, is_gap in zip(_ROW_EDGE_RATIOS[1:].tolist(), _ROW_STEP_IS_GAP.tolist()):
+                y_line = int(y_start + edge_ratio * roi_height)
+                if is_gap:
+                    cv2.line(answer_roi_img, (int(x_start), y_line), (int(x_end), y_line), (255, 255, 0), 2)
+                else:
+                    cv2.line(answer_roi_img, (int(x_start), y_line), (int(x_end), y_line), (255, 0, 0), 1)
 
-        figure(figsize=(20,20), dpi=90)
-        plt.imshow(cv2.cvtColor(answer_roi_img, cv2.COLOR_BGR2RGB))
-        plt.title("Detected Answers ROI (Red) and Calculation Bounding Box (Yellow)")
-        plt.axis('off')
-        plt.savefig('answers_roi_plot.png')
-        print("Plot saved to answers_roi_plot.png")
-        plt.close()   
+            # Detected Answers ROI (Red) and Calculation Bounding Box (Yellow)
+            cv2.imwrite('answers_roi_plot.jpg', answer_roi_img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            print("Plot saved to answers_roi_plot.jpg")   
 
     def calculate_score(self):
         """
@@ -392,57 +450,84 @@ class McqMarker:
             print("Cannot calculate score for a mark scheme.")
             return
 
-        self.score = 0
-        for student_ans in self.student_answer:
-            if student_ans['answer'] == student_ans['correct_answer'] and student_ans['answer'] not in ['X', 'M']:
-                self.score += 1
+        # Blank ('X') and multiple ('M') marks never score, even against the same entry in the scheme
+        answers = np.asarray([s['answer'] for s in self.student_answer], dtype=str)
+        correct = np.asarray([s['correct_answer'] for s in self.student_answer], dtype=str)
+        self.score = int(((answers == correct) & (answers != 'X') & (answers != 'M')).sum())
         
         print(f"\nStudent Score: {self.score}/{self.questions}")       
 
-    def start_shading_processing(self):
-        model = YOLO(self.model_path)
-        img = self.load_image()
+    @classmethod
+    def run_batch(cls, markers):
+        """
+        Runs shading detection for several markers with a single batched YOLO call.
+        """
+        if not markers:
+            return
 
-        results = model(img, conf=0.25, iou=0.7)
+        if len(markers) == 1:
+            # The per-sheet grading path; a thread pool would only add overhead here
+            model = cls._get_model(markers[0].model_path)
+            imgs = [markers[0].load_image()]
+        else:
+            # cv2 decode/resize releases the GIL, so the sheets load in parallel (and alongside the first model load)
+            with ThreadPoolExecutor(max_workers=len(markers)) as ex:
+                pending = ex.map(cls.load_image, markers)
+                model = cls._get_model(markers[0].model_path)
+                imgs = list(pending)
+
+        # All sheets are available up-front, so non-streaming batches amortize inference cost
+        for start in range(0, len(imgs), _EXPORT_MAX_BATCH):
+            batch_imgs = imgs[start:start + _EXPORT_MAX_BATCH]
+            results = model(batch_imgs, conf=0.25, iou=0.7, half=markers[0].half, batch=len(batch_imgs),
+                            verbose=False, stream=False)
+            for marker, r in zip(markers[start:start + _EXPORT_MAX_BATCH], results):
+                marker._collect_detections(r)
 
-        for r in results:
-            for box in r.boxes:
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                class_id = int(box.cls[0])
-                confidence = float(box.conf[0])
-                
-                if class_id == 1:
-                    self.indx_roi_coords = (x1, y1, x2, y2)
-                elif class_id == 2:
-                    self.answers_roi_coords = (x1, y1, x2, y2)
-                elif class_id == 0:
-                    center_x = (x1 + x2) / 2
-                    center_y = (y1 + y2) / 2
-                    
-                    self.detected_indx_marks.append({
-                        "center_x": center_x,
-                        "center_y": center_y,
-                        "confidence": confidence,
-                    })
-                    self.detected_answers_marks.append({
-                        "center_x": center_x,
-                        "center_y": center_y,
-                        "confidence": confidence,
-                    })
-                    
+    def start_shading_processing(self):
+        type(self).run_batch([self])
+
+    @staticmethod
+    def _best_box(xyxy, cls, conf, class_id):
+        rows = np.flatnonzero(cls == class_id)
+        if not rows.size:
+            return None
+        return tuple(xyxy[rows[conf[rows].argmax()]].tolist())
+
+    def _collect_detections(self, r):
+        # One device-to-host copy per tensor instead of a sync per box
+        xyxy = r.boxes.xyxy.cpu().numpy()
+        cls = r.boxes.cls.cpu().numpy().astype(np.int32)
+        conf = r.boxes.conf.cpu().numpy()
+
+        # ROIs (class 1: index, class 2: answers); keep the most confident box of each
+        self.indx_roi_coords = self._best_box(xyxy, cls, conf, 1)
+        self.answers_roi_coords = self._best_box(xyxy, cls, conf, 2)
+
+        # Marks (class 0) as (center_x, center_y, confidence) rows
+        is_mark = cls == 0
+        marks = np.stack([
+            (xyxy[is_mark, 0] + xyxy[is_mark, 2]) / 2,
+            (xyxy[is_mark, 1] + xyxy[is_mark, 3]) / 2,
+            conf[is_mark],
+        ], axis=1).astype(np.float32)
+
+        # --- Partition the marks between the ROIs in one pass ---
+        # Without a detected ROI every mark is kept, as the downstream steps check for the ROI themselves
+        in_indx = self._in_box(marks, self.indx_roi_coords)
+        in_answers = self._in_box(marks, self.answers_roi_coords)
         if self.indx_roi_coords:
-            x_start, y_start, x_end, y_end = self.indx_roi_coords
-            self.detected_indx_marks = [
-                mark for mark in self.detected_indx_marks
-                if x_start <= mark['center_x'] < x_end and y_start <= mark['center_y'] < y_end
-            ]
+            # ROIs are disjoint on a sheet; a mark on an overlapping edge counts towards the index only
+            in_answers &= ~in_indx
+        self.detected_indx_marks = marks[in_indx]
+        self.detected_answers_marks = marks[in_answers]
 
-        if self.answers_roi_coords:
-            x_start, y_start, x_end, y_end = self.answers_roi_coords
-            self.detected_answers_marks = [
-                mark for mark in self.detected_answers_marks
-                if x_start <= mark['center_x'] < x_end and y_start <= mark['center_y'] < y_end
-            ]
+    @staticmethod
+    def _in_box(marks, box):
+        if not box:
+            return np.ones(len(marks), dtype=bool)
+        x_start, y_start, x_end, y_end = box
+        return (marks[:, 0] >= x_start) & (marks[:, 0] < x_end) & (marks[:, 1] >= y_start) & (marks[:, 1] < y_end)
 
 
     def marking_outcome(self):
@@ -460,11 +545,45 @@ class McqMarker:
             }
 
 
+def init_grader_worker(num_threads):
+    """
+    Process pool initializer: caps PyTorch's intra-op threads so concurrent workers
+    share the cores instead of each claiming all of them.
+    """
+    torch.set_num_threads(num_threads)
+
+
+def prepare_model():
+    """
+    Downloads and, if configured, exports the model once, returning its path. Call this
+    before starting grader processes so they only ever load a finished artifact.
+    """
+    return McqMarker(image_path=None, test_id=None, total_questions=0, is_scheme=True).model_path
+
+
+def grade_sheet(image_bytes, test_id, total_questions, is_scheme, scheme):
+    marker = McqMarker(
+        image_path=None,
+        test_id=test_id,
+        total_questions=total_questions,
+        is_scheme=is_scheme,
+        scheme=scheme,
+        image_bytes=image_bytes,
+    )
+    marker.start_shading_processing()
+
+    # Index numbers are only read from student papers
+    if not is_scheme:
+        marker.start_indx_processing()
+
+    marker.start_answer_processing()
+    return marker.marking_outcome()
+
+
 if __name__ == '__main__':
     # --- Example Usage ---
 
-    # --- Step 1: Create a mark scheme from a correctly shaded sheet ---
-    print("--- Processing Mark Scheme ---")
+    # --- Step 1: A correctly shaded sheet to build the mark scheme from ---
     mark_scheme_path = '/home/mysom/Downloads/Cloudinary_Archive_2025-07-30_17_09_40_Originals/1753889363371292.jpg'
     scheme_marker = McqMarker(
         image_path=mark_scheme_path, 
@@ -472,24 +591,29 @@ if __name__ == '__main__':
         total_questions=130, 
         is_scheme=True
     )
-    scheme_marker.start_shading_processing()
-    scheme_marker.start_indx_processing()
-    scheme_marker.start_answer_processing()
-
-    generated_scheme = scheme_marker.mark_scheme
-    print(f"\nGenerated Mark Scheme: {generated_scheme}")
 
-    # --- Step 2: Grade a student's paper using the generated scheme ---
-    print("\n--- Processing Student Paper ---")
+    # --- Step 2: A student's paper to grade against the generated scheme ---
     student_paper_path = '/home/mysom/Downloads/Cloudinary_Archive_2025-07-30_17_09_40_Originals/1753889363371292.jpg'
     student_marker = McqMarker(
         image_path=student_paper_path, 
         test_id='test001', 
         total_questions=130, 
-        is_scheme=False,
-        scheme=generated_scheme
+        is_scheme=False
     )
-    student_marker.start_shading_processing()
+
+    # Detect marks on both sheets with a single batched YOLO call
+    McqMarker.run_batch([scheme_marker, student_marker])
+
+    # --- Step 3: Create the mark scheme, then grade the student's paper with it ---
+    print("--- Processing Mark Scheme ---")
+    scheme_marker.start_indx_processing()
+    scheme_marker.start_answer_processing()
+
+    generated_scheme = scheme_marker.mark_scheme
+    print(f"\nGenerated Mark Scheme: {generated_scheme}")
+
+    print("\n--- Processing Student Paper ---")
+    student_marker.mark_scheme = generated_scheme
     student_marker.start_indx_processing()
     student_marker.start_answer_processing()
-    student_marker.calculate_score()
\ No newline at end of file
+    student_marker.calculate_score()